@@ -4,6 +4,10 @@ from pathlib import Path
 # Base directory of the project (one level up from app/)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Deployment
+# Heroku sets WEB_CONCURRENCY per dyno size; elsewhere default to one worker per core.
+WORKERS = int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
 # CORS
 ALLOWED_ORIGINS = [
     "https://burgerhotdog.github.io",
@@ -12,9 +16,64 @@ ALLOWED_ORIGINS = [
 
 # OCR
 TESSERACT_CONFIG = r"--oem 3 --psm 7"
+# Minimum mean word confidence (0-100) for an OCR tier's result to be accepted
+OCR_MIN_CONFIDENCE = 70
+# Screenshot languages (Tesseract codes); the ones installed are detected per screenshot
+OCR_LANGUAGES = tuple(os.environ.get("OCR_LANGUAGES", "eng,chi_sim").split(","))
+# A Tesseract call running longer than this is killed
+OCR_TIMEOUT_SECONDS = 10
+# How often a waiting request checks whether its client has disconnected
+DISCONNECT_POLL_SECONDS = 0.5
 FUZZY_MATCH_CUTOFF = 0.8
 EXPECTED_IMAGE_SIZE = (1920, 1080)
 TEMPLATE_MATCH_THRESHOLD = 0.8
+# Echo boxes whose grayscale standard deviation is below this hold no text
+BLANK_STDDEV_THRESHOLD = 8.0
+# Pixels kept around the detected text when tightening a crop before OCR
+TIGHT_CROP_MARGIN = 4
+
+# Memory per request: uploads larger than MAX_UPLOAD_BYTES are rejected while reading, and
+# uploads whose raw bytes plus decoded frames would exceed the budget are rejected before decoding
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 8 * 1024 * 1024))
+REQUEST_MEMORY_BUDGET_BYTES = int(os.environ.get("REQUEST_MEMORY_BUDGET_BYTES", 32 * 1024 * 1024))
+# A job holds at most one screenshot in memory at a time, but is capped in count and total size
+MAX_JOB_FILES = int(os.environ.get("MAX_JOB_FILES", 100))
+MAX_JOB_BYTES = int(os.environ.get("MAX_JOB_BYTES", 256 * 1024 * 1024))
+# Trace allocations and record the peak of each pipeline stage (diagnostics only; slow)
+MEMORY_PROFILE = os.environ.get("MEMORY_PROFILE", "") == "1"
 
 # Template image path
 NAME_LV_PATH = BASE_DIR / "nameLV.webp"
+
+# Shared cache (SQLite in WAL mode, so every worker process reads the same entries)
+CACHE_PATH = Path(os.environ.get("CACHE_PATH", BASE_DIR / "cache.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 10000))
+# Cross-process lease on an upload being OCRed: other workers wait for its cached result.
+# The holder extends it every LEASE_REFRESH_SECONDS, so a lease left by a crashed worker
+# lapses after LEASE_SECONDS while a slow pass keeps it.
+LEASE_SECONDS = 120
+LEASE_REFRESH_SECONDS = 30
+LEASE_POLL_SECONDS = 0.25
+
+# Async jobs (stored alongside the cache so they survive a worker restart)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 24 * 60 * 60))
+# Running jobs refresh a heartbeat; one silent for JOB_STALE_SECONDS is requeued by any worker
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = 60
+
+# Admission control (shared by every worker) and fair scheduling (per worker process)
+# Clients are identified by API key (if listed in API_KEYS) or else by IP address
+API_KEY_HEADER = "X-API-Key"
+API_KEYS = {key for key in os.environ.get("API_KEYS", "").split(",") if key}
+# Number of reverse proxies in front of the app that append to X-Forwarded-For (1 on Heroku)
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+# Token bucket per client, in screenshots, kept in the shared SQLite store
+RATE_LIMIT_PER_SECOND = float(os.environ.get("RATE_LIMIT_PER_SECOND", 1.0))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 20))
+# Cost of one screenshot by upload kind; a batch costs the sum
+REQUEST_COSTS = {"screenshot": 1.0, "atlas": 0.5}
+# Share of OCR slots each client class gets under contention
+CLIENT_WEIGHTS = {"api_key": 4.0, "anonymous": 1.0}
+# Requests running OCR at once in each worker process
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", 2))
@@ -0,0 +1,44 @@
+import hashlib
+import json
+
+from app.data.crops import CROPS
+
+# Bump whenever CROPS or the packing below changes, so stale clients are rejected.
+# ATLAS_FINGERPRINT pins the layout this version describes; a layout change without a
+# bump fails at import.
+ATLAS_VERSION = 1
+ATLAS_FINGERPRINT = 'a3a13d4947b91b9e'
+
+# Shelf width: the avatar name strip (which holds the nameLV anchor) is the widest region
+ATLAS_WIDTH = CROPS['avatar_name'][2] - CROPS['avatar_name'][0]
+
+
+def _pack():
+    """
+    Place every CROPS region except avatar_color, in CROPS order, left to right on
+    shelves ATLAS_WIDTH wide. A region that does not fit starts a new shelf below the
+    tallest region of the current one.
+    """
+    layout = {}
+    x = y = shelf_height = 0
+    for key, (left, top, right, bottom) in CROPS.items():
+        if key == 'avatar_color':
+            continue
+        width, height = right - left, bottom - top
+        if x + width > ATLAS_WIDTH:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        layout[key] = (x, y, x + width, y + height)
+        x += width
+        shelf_height = max(shelf_height, height)
+    return layout, (ATLAS_WIDTH, y + shelf_height)
+
+
+# Box of each region inside the atlas, in the same (left, top, right, bottom) form as CROPS
+ATLAS_LAYOUT, ATLAS_SIZE = _pack()
+
+_fingerprint = hashlib.blake2b(json.dumps([ATLAS_LAYOUT, ATLAS_SIZE]).encode(), digest_size=8).hexdigest()
+if _fingerprint != ATLAS_FINGERPRINT:
+    raise RuntimeError(
+        f"Atlas layout changed (fingerprint {_fingerprint}). Bump ATLAS_VERSION and set "
+        f"ATLAS_FINGERPRINT to the new fingerprint."
+    )
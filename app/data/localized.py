@@ -0,0 +1,38 @@
+# In-game labels for languages other than English, keyed by Tesseract language code.
+# Each table maps to the same IDs as its English counterpart in app/data/.
+# A language whose avatar_names or weapon_names table is empty does not report avatarId or
+# weaponId, since its screenshots show localized names that could not be matched.
+LOCALIZED = {
+    'chi_sim': {
+        'mainstats': {
+            '生命': 'HP',
+            '攻击': 'ATK',
+            '防御': 'DEF',
+            '暴击': 'CR',
+            '暴击伤害': 'CD',
+            '治疗效果加成': 'HB',
+            '气动伤害加成': 'AERO',
+            '导电伤害加成': 'ELECTRO',
+            '衍射伤害加成': 'SPECTRO',
+            '湮灭伤害加成': 'HAVOC',
+            '冷凝伤害加成': 'GLACIO',
+            '热熔伤害加成': 'FUSION',
+            '共鸣效率': 'ER',
+        },
+        'substats': {
+            '生命': 'HP',
+            '攻击': 'ATK',
+            '防御': 'DEF',
+            '暴击': 'CR',
+            '暴击伤害': 'CD',
+            '共鸣效率': 'ER',
+            '普攻伤害加成': 'BA',
+            '重击伤害加成': 'HA',
+            '共鸣技能伤害加成': 'RS',
+            '共鸣解放伤害加成': 'RL',
+        },
+        # Not yet transcribed
+        'avatar_names': {},
+        'weapon_names': {},
+    },
+}
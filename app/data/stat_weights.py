@@ -0,0 +1,47 @@
+# How much each stat is worth to a character. Substat IDs weigh one maximum roll of that
+# substat; main stat IDs (from MAINSTATS) weigh having that main stat.
+DEFAULT_WEIGHTS = {
+    'PERCENT_CR': 1.0,
+    'PERCENT_CD': 1.0,
+    'PERCENT_ATK': 0.6,
+    'FLAT_ATK': 0.2,
+    'PERCENT_ER': 0.3,
+    'CR': 1.0,
+    'CD': 1.0,
+    'ATK': 0.5,
+    'ER': 0.3,
+    'AERO': 1.0,
+    'ELECTRO': 1.0,
+    'SPECTRO': 1.0,
+    'HAVOC': 1.0,
+    'GLACIO': 1.0,
+    'FUSION': 1.0,
+}
+
+# Per-character changes to DEFAULT_WEIGHTS, keyed by the IDs in AVATAR_NAMES
+CHARACTER_WEIGHTS = {
+    # Verina
+    '1503': {'PERCENT_CR': 0.2, 'PERCENT_CD': 0.2, 'PERCENT_ER': 1.0, 'CR': 0.2, 'CD': 0.2, 'ATK': 1.0, 'HB': 1.0},
+    # The Shorekeeper
+    '1505': {'PERCENT_HP': 1.0, 'FLAT_HP': 0.3, 'PERCENT_ATK': 0.0, 'FLAT_ATK': 0.0, 'PERCENT_ER': 1.0, 'HP': 1.0, 'ATK': 0.0, 'HB': 1.0},
+    # Baizhi
+    '1103': {'PERCENT_HP': 1.0, 'FLAT_HP': 0.3, 'PERCENT_ATK': 0.0, 'FLAT_ATK': 0.0, 'PERCENT_ER': 1.0, 'HP': 1.0, 'ATK': 0.0, 'HB': 1.0},
+    # Taoqi
+    '1601': {'PERCENT_DEF': 1.0, 'FLAT_DEF': 0.3, 'PERCENT_ATK': 0.0, 'FLAT_ATK': 0.0, 'PERCENT_ER': 1.0, 'DEF': 1.0, 'ATK': 0.0},
+    # Encore
+    '1203': {'PERCENT_BA': 0.6},
+    # Camellya
+    '1603': {'PERCENT_BA': 0.6},
+    # Jiyan
+    '1404': {'PERCENT_HA': 0.6},
+    # Changli
+    '1205': {'PERCENT_RS': 0.5, 'PERCENT_RL': 0.4},
+    # Jinhsi
+    '1304': {'PERCENT_RS': 0.6},
+    # Calcharo
+    '1301': {'PERCENT_RL': 0.6},
+    # Xiangli Yao
+    '1305': {'PERCENT_RL': 0.6},
+    # Carlotta
+    '1107': {'PERCENT_RS': 0.6},
+}
@@ -0,0 +1,16 @@
+# Every value a substat can roll, as displayed in game (percent stats in %)
+SUBSTAT_ROLLS = {
+    'FLAT_HP': [320, 360, 390, 430, 470, 510, 540, 580],
+    'FLAT_ATK': [30, 40, 50, 60],
+    'FLAT_DEF': [40, 50, 60, 70],
+    'PERCENT_HP': [6.4, 7.1, 7.9, 8.6, 9.4, 10.1, 10.9, 11.6],
+    'PERCENT_ATK': [6.4, 7.1, 7.9, 8.6, 9.4, 10.1, 10.9, 11.6],
+    'PERCENT_DEF': [8.1, 9.0, 10.0, 10.9, 11.8, 12.8, 13.8, 14.7],
+    'PERCENT_CR': [6.3, 6.9, 7.5, 8.1, 8.7, 9.3, 9.9, 10.5],
+    'PERCENT_CD': [12.6, 13.8, 15.0, 16.2, 17.4, 18.6, 19.8, 21.0],
+    'PERCENT_ER': [6.8, 7.6, 8.4, 9.2, 10.0, 10.8, 11.6, 12.4],
+    'PERCENT_BA': [6.4, 7.1, 7.9, 8.6, 9.4, 10.1, 10.9, 11.6],
+    'PERCENT_HA': [6.4, 7.1, 7.9, 8.6, 9.4, 10.1, 10.9, 11.6],
+    'PERCENT_RS': [6.4, 7.1, 7.9, 8.6, 9.4, 10.1, 10.9, 11.6],
+    'PERCENT_RL': [6.4, 7.1, 7.9, 8.6, 9.4, 10.1, 10.9, 11.6],
+}
@@ -0,0 +1,27 @@
+import hashlib
+import json
+
+from app.data.atlas import ATLAS_LAYOUT
+from app.data.avatar_names import AVATAR_NAMES
+from app.data.crops import CROPS
+from app.data.localized import LOCALIZED
+from app.data.mainstats import MAINSTATS
+from app.data.stat_weights import CHARACTER_WEIGHTS, DEFAULT_WEIGHTS
+from app.data.substat_rolls import SUBSTAT_ROLLS
+from app.data.substats import SUBSTATS
+from app.data.weapon_names import WEAPON_NAMES
+
+
+def _fingerprint(tables: list) -> str:
+    return hashlib.blake2b(json.dumps(tables, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+# Fingerprint of every table that shapes OCR output. It is part of cache keys and ETags,
+# so results computed with older tables are never served after an update.
+DATA_VERSION = _fingerprint(
+    [ATLAS_LAYOUT, AVATAR_NAMES, CROPS, LOCALIZED, MAINSTATS, SUBSTAT_ROLLS, SUBSTATS, WEAPON_NAMES]
+)
+
+# Scores are computed per response, so the weights only go into the ETags of scored
+# responses, and tuning them keeps the OCR cache.
+WEIGHTS_VERSION = _fingerprint([CHARACTER_WEIGHTS, DEFAULT_WEIGHTS])
@@ -1,10 +1,24 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import ALLOWED_ORIGINS
+from app.routes.metrics import router as metrics_router
 from app.routes.ocr import router as ocr_router
+from app.routes.score import router as score_router
+from app.services import jobs, languages, memprofile
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    memprofile.start()
+    languages.preload()
+    jobs.start()
+    yield
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,3 +29,5 @@ app.add_middleware(
 )
 
 app.include_router(ocr_router)
+app.include_router(score_router)
+app.include_router(metrics_router)
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return JSONResponse(content=metrics.snapshot())
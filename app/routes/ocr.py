@@ -1,24 +1,274 @@
-from fastapi import APIRouter, File, UploadFile
-from fastapi.responses import JSONResponse
-from PIL import Image
-import io
+import asyncio
+import hashlib
+import math
 
-from app.services.ocr_service import process_image
+import orjson
+
+from fastapi import APIRouter, File, Request, UploadFile
+from fastapi.responses import ORJSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from app.config import (
+    DISCONNECT_POLL_SECONDS,
+    LEASE_POLL_SECONDS,
+    LEASE_REFRESH_SECONDS,
+    MAX_JOB_BYTES,
+    MAX_JOB_FILES,
+    MAX_UPLOAD_BYTES,
+    REQUEST_COSTS,
+)
+from app.data.atlas import ATLAS_LAYOUT, ATLAS_SIZE, ATLAS_VERSION
+from app.data.version import WEIGHTS_VERSION
+from app.services import cache, jobs, lease, scheduler, singleflight
+from app.services.ocr_service import (
+    TEMPLATE_MATCH_ERROR,
+    MemoryBudgetExceeded,
+    check_cancelled,
+    process_upload,
+    resolve_fields,
+    result_key,
+)
+from app.services.scoring import score_builds
 
 router = APIRouter()
 
+_CHUNK_SIZE = 64 * 1024
 
-@router.post("/ocr/")
-async def ocr(file: UploadFile = File(...)):
-    contents = await file.read()
-    image = Image.open(io.BytesIO(contents))
 
-    result = process_image(image)
+class UploadTooLarge(Exception):
+    pass
+
+
+async def _read_upload(file: UploadFile) -> bytearray:
+    """Read an upload in chunks, giving up as soon as it passes MAX_UPLOAD_BYTES."""
+    contents = bytearray()
+    try:
+        while chunk := await file.read(_CHUNK_SIZE):
+            contents += chunk
+            if len(contents) > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge(f"Upload is larger than {MAX_UPLOAD_BYTES / 2**20:.1f} MiB")
+    finally:
+        await file.close()
+    return contents
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _keep_lease(key: str, token: str) -> None:
+    """Refresh the lease on key while it is held, so a long slot wait or pass never outlives it."""
+    while True:
+        await asyncio.sleep(LEASE_REFRESH_SECONDS)
+        if not lease.refresh(key, token):
+            return
+
+
+def _etag(key: str, score: bool) -> str:
+    """
+    Strong ETag for a result: the content hash, data version and field mask, plus the
+    weights version for a scored response.
+    """
+    tag = hashlib.blake2b(f"{key}:{WEIGHTS_VERSION if score else ''}".encode(), digest_size=16).hexdigest()
+    return f'"{tag}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    # "*" is not honored, as it would answer 304 for uploads never OCRed.
+    # If-None-Match uses weak comparison.
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def _rate_limited(e: scheduler.RateLimited) -> Response:
+    return ORJSONResponse(
+        status_code=429,
+        content={"error": str(e)},
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+async def _ocr_upload(
+    request: Request,
+    file: UploadFile,
+    fields: str | None,
+    ref: str | None,
+    score: bool = False,
+    atlas: bool = False,
+):
+    try:
+        keys = resolve_fields(fields.split(",") if fields else None)
+    except ValueError as e:
+        return ORJSONResponse(status_code=400, content={"error": str(e)})
+
+    try:
+        # A bytearray, so process_upload can free it as soon as the image is decoded
+        contents = await _read_upload(file)
+    except UploadTooLarge as e:
+        return ORJSONResponse(status_code=413, content={"error": str(e)})
+    digest = cache.content_hash(contents)
+    key = result_key(digest, keys)
+    etag = _etag(key, score)
+
+    # The same upload under the same data tables always gives the same result
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cached = cache.get_raw("result", key)
+    if cached is not None:
+        if not score:
+            # Cached results are stored as serialized JSON and sent as they are
+            return Response(content=cached, media_type="application/json", headers={"ETag": etag})
+        return _ocr_response(orjson.loads(cached), score, etag)
+
+    client, client_class = scheduler.identify(request)
+    cost = REQUEST_COSTS["atlas" if atlas else "screenshot"]
+    try:
+        await run_in_threadpool(scheduler.admit, client, cost)
+    except scheduler.RateLimited as e:
+        return _rate_limited(e)
+
+    # Identical uploads arriving together share a single OCR pass, across worker
+    # processes too. The flight is registered before its slot is granted, so
+    # duplicates never queue for slots.
+    # ref is the content hash of an earlier upload whose unchanged regions can be reused.
+    # OCR stops once every client waiting on it has disconnected.
+    args = (key, client, client_class, cost, contents, digest, None, keys, ref, atlas)
+    try:
+        result = await singleflight.run(key, _process, *args, disconnected=_wait_for_disconnect(request))
+    except ConnectionAbortedError:
+        # Nobody is left to read the response
+        return Response(status_code=499)
+    except MemoryBudgetExceeded as e:
+        return ORJSONResponse(status_code=413, content={"error": str(e)})
 
     if result is None:
-        return JSONResponse(status_code=400, content={"error": "Could not detect character name region"})
+        return ORJSONResponse(status_code=400, content={"error": TEMPLATE_MATCH_ERROR})
 
     if "error" in result:
-        return JSONResponse(status_code=400, content=result)
+        return ORJSONResponse(status_code=400, content=result)
+
+    return _ocr_response(result, score, etag)
+
+
+async def _process(key: str, client: str, client_class: str, cost: float, *args, cancel):
+    """
+    Take the lease on key, wait for an OCR slot, then run process_upload(*args) in the
+    threadpool. While another worker process holds the lease, wait for the result it caches.
+    """
+    token = lease.acquire(key)
+    while token is None:
+        check_cancelled(cancel)
+        await asyncio.sleep(LEASE_POLL_SECONDS)
+        cached = cache.get("result", key)
+        if cached is not None:
+            return cached
+        # Lease released without a cached result (the other pass failed), or lapsed
+        token = lease.acquire(key)
+
+    keeper = asyncio.create_task(_keep_lease(key, token))
+    try:
+        # The previous holder may have cached the result just before releasing
+        cached = cache.get("result", key)
+        if cached is not None:
+            return cached
+        async with scheduler.slot(client, client_class, cost):
+            # Every client may have left while this waited for the slot
+            check_cancelled(cancel)
+            return await run_in_threadpool(process_upload, *args, cancel=cancel)
+    finally:
+        keeper.cancel()
+        lease.release(key, token)
+
+
+def _ocr_response(result: dict, score: bool, etag: str) -> Response:
+    if score and "equipList" in result:
+        # Scored per request so cached results stay valid when weights change
+        result = result | score_builds([result])[0]
+    return ORJSONResponse(content=result, headers={"ETag": etag})
+
+
+@router.post("/ocr/")
+async def ocr(
+    request: Request,
+    file: UploadFile = File(...),
+    fields: str | None = None,
+    ref: str | None = None,
+    score: bool = False,
+):
+    return await _ocr_upload(request, file, fields, ref, score)
+
+
+@router.post("/ocr/atlas")
+async def ocr_atlas(
+    request: Request,
+    version: int,
+    file: UploadFile = File(...),
+    fields: str | None = None,
+    ref: str | None = None,
+    score: bool = False,
+):
+    if version != ATLAS_VERSION:
+        return ORJSONResponse(
+            status_code=400,
+            content={"error": f"Unsupported atlas layout version {version}. Expected {ATLAS_VERSION}"},
+        )
+    return await _ocr_upload(request, file, fields, ref, score, atlas=True)
+
+
+@router.get("/ocr/atlas/layout")
+async def atlas_layout():
+    return ORJSONResponse(content={"version": ATLAS_VERSION, "size": ATLAS_SIZE, "regions": ATLAS_LAYOUT})
+
+
+@router.post("/ocr/jobs")
+async def create_job(request: Request, files: list[UploadFile] = File(...), priority: int = 0):
+    if len(files) > MAX_JOB_FILES:
+        return ORJSONResponse(status_code=413, content={"error": f"A job takes at most {MAX_JOB_FILES} files"})
+    too_large = f"A job takes at most {MAX_JOB_BYTES / 2**20:.1f} MiB of files"
+    # The multipart parser has already spooled the files, so their sizes are known up front
+    if sum(file.size or 0 for file in files) > MAX_JOB_BYTES:
+        return ORJSONResponse(status_code=413, content={"error": too_large})
+
+    client, client_class = scheduler.identify(request)
+    if priority and client_class != "api_key":
+        return ORJSONResponse(status_code=403, content={"error": "Only API-key clients can set priority"})
+    try:
+        await run_in_threadpool(scheduler.admit, client, REQUEST_COSTS["screenshot"] * len(files))
+    except scheduler.RateLimited as e:
+        return _rate_limited(e)
+
+    # Each screenshot goes to the job store as soon as it is read, so only one is in memory.
+    # Store writes run in the threadpool: they can wait on another process's write lock.
+    job_id = await run_in_threadpool(jobs.create, len(files), priority, client, client_class)
+    total = 0
+    try:
+        for idx, file in enumerate(files):
+            contents = await _read_upload(file)
+            total += len(contents)
+            if total > MAX_JOB_BYTES:
+                raise UploadTooLarge(too_large)
+            await run_in_threadpool(jobs.add_file, job_id, idx, contents)
+            del contents
+    except UploadTooLarge as e:
+        await run_in_threadpool(jobs.discard, job_id)
+        return ORJSONResponse(status_code=413, content={"error": str(e)})
+    await run_in_threadpool(jobs.enqueue, job_id)
+    return ORJSONResponse(status_code=202, content={"id": job_id, "status": "queued"})
+
+
+@router.get("/ocr/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(jobs.get, job_id)
+    if job is None:
+        return ORJSONResponse(status_code=404, content={"error": "Job not found"})
+    return ORJSONResponse(content=job)
+
 
-    return JSONResponse(content=result)
+@router.delete("/ocr/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if not await run_in_threadpool(jobs.cancel, job_id):
+        return ORJSONResponse(status_code=404, content={"error": "Job not found or already finished"})
+    return ORJSONResponse(content={"id": job_id, "status": "cancelled"})
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Body
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.services.scoring import score_builds
+
+router = APIRouter()
+
+
+# The shape of /ocr/ output; other keys (weaponId, valueFlag, ...) are accepted and ignored
+class SubStat(BaseModel):
+    subStatId: str | None = None
+    subStatValue: float | None = None
+
+
+class Echo(BaseModel):
+    mainStatId: str | None = None
+    subStatList: list[SubStat | None] | None = None
+
+
+class Build(BaseModel):
+    avatarId: str | None = None
+    equipList: list[Echo | None] | None = None
+
+
+@router.post("/score")
+async def score(builds: list[Build] = Body(..., embed=True)):
+    return JSONResponse(content={"scores": score_builds([build.model_dump() for build in builds])})
@@ -0,0 +1,70 @@
+import hashlib
+import time
+
+import orjson
+
+from app.config import CACHE_MAX_ENTRIES
+from app.services.db import get_connection
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+_initialized = False
+
+
+def _conn():
+    global _initialized
+    conn = get_connection()
+    if not _initialized:
+        conn.execute(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def content_hash(data: bytes) -> str:
+    """Stable key for an uploaded file, shared by every worker process."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_raw(namespace: str, key: str) -> bytes | None:
+    """Return the cached value still serialized as JSON, or None on a miss."""
+    row = _conn().execute(
+        "SELECT value FROM cache WHERE namespace = ? AND key = ?",
+        (namespace, key),
+    ).fetchone()
+    if row is None:
+        return None
+    # Rows written before values were stored as bytes come back as str
+    return row[0].encode() if isinstance(row[0], str) else row[0]
+
+
+def get(namespace: str, key: str):
+    """Return the cached value, or None on a miss."""
+    raw = get_raw(namespace, key)
+    return None if raw is None else orjson.loads(raw)
+
+
+def put(namespace: str, key: str, value) -> None:
+    """Store a JSON-serializable value and evict the oldest entries past CACHE_MAX_ENTRIES."""
+    conn = _conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO cache (namespace, key, value, created) VALUES (?, ?, ?, ?)",
+        (namespace, key, orjson.dumps(value), time.time()),
+    )
+    # REPLACE assigns a fresh rowid, so rowid order is write order
+    conn.execute(
+        """
+        DELETE FROM cache WHERE namespace = ? AND rowid <= (
+            SELECT rowid FROM cache WHERE namespace = ?
+            ORDER BY rowid DESC LIMIT 1 OFFSET ?
+        )
+        """,
+        (namespace, namespace, CACHE_MAX_ENTRIES),
+    )
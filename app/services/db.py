@@ -0,0 +1,20 @@
+import sqlite3
+import threading
+
+from app.config import CACHE_PATH
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Return this thread's connection to the shared SQLite store.
+    WAL mode lets readers in every worker process proceed while one writes.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
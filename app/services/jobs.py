@@ -0,0 +1,330 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from app.config import (
+    JOB_HEARTBEAT_SECONDS,
+    JOB_RETENTION_SECONDS,
+    JOB_STALE_SECONDS,
+    JOB_WORKERS,
+    REQUEST_COSTS,
+)
+from app.services import cache, scheduler
+from app.services.db import get_connection
+from app.services.ocr_service import TEMPLATE_MATCH_ERROR, OCRCancelled, process_upload, result_key
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    created REAL NOT NULL,
+    finished REAL,
+    owner_pid INTEGER,
+    heartbeat REAL,
+    client TEXT,
+    client_class TEXT,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    echoes_done INTEGER NOT NULL DEFAULT 0,
+    results TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+# Ordered by (-priority, created): higher priority first, then oldest first
+_queue: queue.PriorityQueue = queue.PriorityQueue()
+_started = False
+# Event loop whose fair queue job screenshots wait in for OCR slots
+_loop: asyncio.AbstractEventLoop | None = None
+# Jobs running in this process, whose heartbeat it keeps fresh
+_running: set[str] = set()
+_running_lock = threading.Lock()
+
+
+def create(total: int, priority: int = 0, client: str = "", client_class: str = "anonymous") -> str:
+    """
+    Start a job for total screenshots, owned by client for fair scheduling. Add each with add_file as it is read, then queue
+    the job with enqueue, or drop it with discard. Returns the job ID.
+    """
+    job_id = uuid.uuid4().hex
+    created = time.time()
+    expired = created - JOB_RETENTION_SECONDS
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN")
+        # Uploads still unfinished after the retention period were abandoned by a dead worker
+        conn.execute(
+            """
+            DELETE FROM job_files WHERE job_id IN (
+                SELECT id FROM jobs WHERE status = 'uploading' AND created < ?
+            )
+            """,
+            (expired,),
+        )
+        conn.execute(
+            """
+            DELETE FROM jobs
+            WHERE (finished IS NOT NULL AND finished < ?) OR (status = 'uploading' AND created < ?)
+            """,
+            (expired, expired),
+        )
+        conn.execute(
+            """
+            INSERT INTO jobs (id, status, priority, created, total, client, client_class)
+            VALUES (?, 'uploading', ?, ?, ?, ?, ?)
+            """,
+            (job_id, priority, created, total, client, client_class),
+        )
+    return job_id
+
+
+def add_file(job_id: str, idx: int, data: bytes | bytearray) -> None:
+    get_connection().execute(
+        "INSERT INTO job_files (job_id, idx, data) VALUES (?, ?, ?)", (job_id, idx, data)
+    )
+
+
+def enqueue(job_id: str) -> None:
+    """Queue a job once all its screenshots are added."""
+    priority, created = get_connection().execute(
+        "UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'uploading' RETURNING priority, created",
+        (job_id,),
+    ).fetchone()
+    _queue.put((-priority, created, job_id))
+
+
+def discard(job_id: str) -> None:
+    """Drop a job whose upload failed."""
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+def get(job_id: str) -> dict | None:
+    """Return the job's status, progress and results so far, or None if unknown."""
+    row = get_connection().execute(
+        "SELECT status, total, done, echoes_done, results FROM jobs WHERE id = ?",
+        (job_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    status, total, done, echoes_done, results = row
+    return {
+        "id": job_id,
+        "status": status,
+        "progress": {
+            "screenshots": {"done": done, "total": total},
+            "echoes": {"done": echoes_done, "total": total * 5},
+        },
+        "results": json.loads(results),
+    }
+
+
+def cancel(job_id: str) -> bool:
+    """Cancel a queued or running job. Returns False if it is unknown or already finished."""
+    conn = get_connection()
+    cur = conn.execute(
+        "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status IN ('queued', 'running')",
+        (time.time(), job_id),
+    )
+    if cur.rowcount == 1:
+        conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+    return cur.rowcount == 1
+
+
+class _CancelToken:
+    """Cancel token for the pipeline that is set once the job is cancelled, from any process."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def is_set(self) -> bool:
+        row = get_connection().execute("SELECT status FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+        return row is None or row[0] == "cancelled"
+
+
+def _claim(job_id: str) -> bool:
+    cur = get_connection().execute(
+        "UPDATE jobs SET status = 'running', owner_pid = ?, heartbeat = ? WHERE id = ? AND status = 'queued'",
+        (os.getpid(), time.time(), job_id),
+    )
+    return cur.rowcount == 1
+
+
+def _run_job(job_id: str) -> None:
+    conn = get_connection()
+    total, done, results, client, client_class = conn.execute(
+        "SELECT total, done, results, client, client_class FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    results = json.loads(results)
+    token = _CancelToken(job_id)
+
+    def on_echo(_):
+        conn.execute("UPDATE jobs SET echoes_done = echoes_done + 1 WHERE id = ?", (job_id,))
+
+    # Resume after the last finished screenshot if the job was interrupted
+    for idx in range(done, total):
+        row = conn.execute(
+            "SELECT data FROM job_files WHERE job_id = ? AND idx = ?", (job_id, idx)
+        ).fetchone()
+        if row is None or token.is_set():
+            return
+        digest = cache.content_hash(row[0])
+        result = cache.get("result", result_key(digest))
+        if result is None:
+            try:
+                # Each screenshot waits its turn in the fair queue as its owner
+                with _slot(client or f"job:{job_id}", client_class or "anonymous"):
+                    result = process_upload(row[0], digest, on_echo, cancel=token)
+            except OCRCancelled:
+                return
+            except Exception as e:
+                result = {"error": str(e)}
+            if result is None:
+                result = {"error": TEMPLATE_MATCH_ERROR}
+        results.append(result)
+        conn.execute(
+            "UPDATE jobs SET done = ?, echoes_done = ?, results = ? WHERE id = ?",
+            (idx + 1, (idx + 1) * 5, json.dumps(results), job_id),
+        )
+
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute(
+            "UPDATE jobs SET status = 'done', finished = ? WHERE id = ? AND status = 'running'",
+            (time.time(), job_id),
+        )
+        conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+
+
+@contextmanager
+def _slot(client: str, client_class: str):
+    if _loop is None:
+        # Not started from a running server (e.g. a script), so there is no queue to join
+        yield
+        return
+    with scheduler.thread_slot(_loop, client, client_class, REQUEST_COSTS["screenshot"]):
+        yield
+
+
+def _fail(job_id: str) -> None:
+    conn = get_connection()
+    cur = conn.execute(
+        "UPDATE jobs SET status = 'failed', finished = ? WHERE id = ? AND status = 'running'",
+        (time.time(), job_id),
+    )
+    if cur.rowcount == 1:
+        conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+
+
+def _worker() -> None:
+    while True:
+        _, _, job_id = _queue.get()
+        try:
+            if _claim(job_id):
+                with _running_lock:
+                    _running.add(job_id)
+                try:
+                    _run_job(job_id)
+                finally:
+                    with _running_lock:
+                        _running.discard(job_id)
+        except Exception:
+            # Screenshot errors are recorded per result; this is the job itself failing
+            logger.exception("Job %s failed", job_id)
+            try:
+                _fail(job_id)
+            except Exception:
+                logger.exception("Could not mark job %s as failed", job_id)
+        finally:
+            _queue.task_done()
+
+
+def _requeue_stale() -> None:
+    """
+    Requeue running jobs whose owner stopped refreshing their heartbeat: its process died,
+    possibly in an earlier container whose PIDs have since been reused.
+    """
+    for job_id, priority, created in get_connection().execute(
+        """
+        UPDATE jobs SET status = 'queued', owner_pid = NULL, heartbeat = NULL
+        WHERE status = 'running' AND heartbeat < ?
+        RETURNING id, priority, created
+        """,
+        (time.time() - JOB_STALE_SECONDS,),
+    ).fetchall():
+        _queue.put((-priority, created, job_id))
+
+
+def _heartbeat() -> None:
+    conn = get_connection()
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            with _running_lock:
+                running = list(_running)
+            conn.executemany(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND status = 'running'",
+                [(time.time(), job_id) for job_id in running],
+            )
+            _requeue_stale()
+        except Exception:
+            logger.exception("Job heartbeat failed")
+
+
+def _migrate() -> None:
+    conn = get_connection()
+    conn.executescript(_SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column in ("client", "client_class"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+    if "heartbeat" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat REAL")
+        # Jobs running before heartbeats existed count as stale
+        conn.execute("UPDATE jobs SET heartbeat = 0 WHERE status = 'running'")
+
+
+def _recover() -> None:
+    """Requeue jobs left running by a dead process and queue every pending job."""
+    _requeue_stale()
+    for job_id, priority, created in get_connection().execute(
+        "SELECT id, priority, created FROM jobs WHERE status = 'queued'"
+    ).fetchall():
+        _queue.put((-priority, created, job_id))
+
+
+def start() -> None:
+    """
+    Create the job tables, recover interrupted jobs and start the worker threads.
+    Called from a running event loop, job OCR shares that loop's fair queue for slots.
+    """
+    global _started, _loop
+    if _started:
+        return
+    try:
+        _loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _loop = None
+    _migrate()
+    _recover()
+    for _ in range(JOB_WORKERS):
+        threading.Thread(target=_worker, daemon=True).start()
+    threading.Thread(target=_heartbeat, daemon=True).start()
+    _started = True
@@ -0,0 +1,117 @@
+import logging
+import re
+
+from PIL import Image
+from pytesseract import get_languages
+
+from app.config import OCR_LANGUAGES, TESSERACT_CONFIG
+from app.data.avatar_names import AVATAR_NAMES
+from app.data.localized import LOCALIZED
+from app.data.mainstats import MAINSTATS
+from app.data.substats import SUBSTATS
+from app.data.weapon_names import WEAPON_NAMES
+from app.services import metrics, tesseract
+
+logger = logging.getLogger(__name__)
+
+_ENGLISH = {
+    "avatar_names": AVATAR_NAMES,
+    "weapon_names": WEAPON_NAMES,
+    "mainstats": MAINSTATS,
+    "substats": SUBSTATS,
+}
+
+# Lookup tables per language, built once at import
+VOCABULARIES = {"eng": _ENGLISH} | {
+    lang: {
+        # Names may be shown untranslated, so they keep the English entries as well
+        "avatar_names": AVATAR_NAMES | tables["avatar_names"],
+        "weapon_names": WEAPON_NAMES | tables["weapon_names"],
+        "mainstats": tables["mainstats"],
+        "substats": tables["substats"],
+    }
+    for lang, tables in LOCALIZED.items()
+}
+
+# Name fields each language can read into IDs
+NAME_FIELDS = {"eng": {"avatar_name", "weapon_name"}} | {
+    lang: {
+        field
+        for field, table in (("avatar_name", tables["avatar_names"]), ("weapon_name", tables["weapon_names"]))
+        if table
+    }
+    for lang, tables in LOCALIZED.items()
+}
+
+# Characters each language's stat labels can contain, for the restricted OCR tier
+STAT_CHARS = {
+    lang: "".join(sorted(set("".join(tables["mainstats"]) + "".join(tables["substats"])) - {" "}))
+    for lang, tables in VOCABULARIES.items()
+}
+
+# Script that identifies each non-Latin language in OCR output
+_SCRIPTS = {
+    "chi_sim": re.compile(r"[\u4e00-\u9fff]"),
+}
+
+# Languages whose words Tesseract splits per character
+UNSPACED_LANGUAGES = {"chi_sim"}
+
+_available: tuple[str, ...] | None = None
+
+
+def available_languages() -> tuple[str, ...]:
+    """The configured languages that have both vocabularies and installed Tesseract data."""
+    global _available
+    if _available is None:
+        try:
+            installed = set(get_languages(config=""))
+        except Exception:
+            logger.warning("Could not list Tesseract languages; using English only")
+            installed = {"eng"}
+        _available = tuple(
+            lang for lang in OCR_LANGUAGES if lang in VOCABULARIES and lang in installed
+        ) or ("eng",)
+    return _available
+
+
+def preload() -> None:
+    """Resolve the available languages at startup instead of on the first request."""
+    logger.info("OCR languages: %s", ", ".join(available_languages()))
+
+
+def language_of(text: str) -> str:
+    """
+    Classify OCR output among the available languages by the script of most of its
+    characters, so a stray misread character (e.g. "丨" for "I") does not decide it.
+    """
+    languages = available_languages()
+    chars = [char for char in text if not char.isspace()]
+    for lang in languages:
+        script = _SCRIPTS.get(lang)
+        if script is not None and len(script.findall(text)) * 2 > len(chars):
+            return lang
+    return "eng" if "eng" in languages else languages[0]
+
+
+def detect_language(crop: Image.Image, cancel=None) -> tuple[str, str | None]:
+    """
+    Pick the screenshot's language from one crop, read once with every available
+    language model combined and classified by the script of the result.
+    Returns the language and the text read (None if only one language is available).
+    A read that times out or is cancelled falls back to English with no text; the
+    caller checks cancel itself.
+    """
+    languages = available_languages()
+    default = "eng" if "eng" in languages else languages[0]
+    if len(languages) == 1:
+        return languages[0], None
+    try:
+        text = tesseract.image_to_string(crop, "+".join(languages), TESSERACT_CONFIG, cancel)
+    except tesseract.TesseractTimeout:
+        metrics.increment("ocr.timeout")
+        return default, None
+    if text is None:
+        return default, None
+    text = text.strip()
+    return language_of(text), text
@@ -0,0 +1,55 @@
+import time
+import uuid
+
+from app.config import LEASE_SECONDS
+from app.services.db import get_connection
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+)
+"""
+
+_initialized = False
+
+
+def _conn():
+    global _initialized
+    conn = get_connection()
+    if not _initialized:
+        conn.execute(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def acquire(key: str) -> str | None:
+    """
+    Take the lease on key for LEASE_SECONDS, shared by every worker process.
+    Returns a token for release(), or None while another holder's lease is live.
+    """
+    token = uuid.uuid4().hex
+    now = time.time()
+    cursor = _conn().execute(
+        """
+        INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+        WHERE leases.expires < ?
+        """,
+        (key, token, now + LEASE_SECONDS, now),
+    )
+    return token if cursor.rowcount else None
+
+
+def refresh(key: str, token: str) -> bool:
+    """Extend the lease on key by LEASE_SECONDS. Returns False if token no longer holds it."""
+    cursor = _conn().execute(
+        "UPDATE leases SET expires = ? WHERE key = ? AND owner = ?",
+        (time.time() + LEASE_SECONDS, key, token),
+    )
+    return cursor.rowcount > 0
+
+
+def release(key: str, token: str) -> None:
+    _conn().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, token))
@@ -0,0 +1,33 @@
+import logging
+import tracemalloc
+from contextlib import contextmanager
+
+from app.config import MEMORY_PROFILE
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def start() -> None:
+    if MEMORY_PROFILE and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    With MEMORY_PROFILE set, record the peak traced allocation (Python and NumPy memory,
+    above what was live on entry) while the block runs. The peak is process-wide, so
+    profile with one request at a time.
+    """
+    if not tracemalloc.is_tracing():
+        yield
+        return
+    start_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        metrics.record_peak(f"memory.{name}", peak - start_bytes)
+        logger.info("stage %s peaked at %d bytes", name, peak - start_bytes)
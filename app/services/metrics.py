@@ -0,0 +1,43 @@
+import os
+import threading
+from collections import Counter
+
+# Counters for this worker process
+_lock = threading.Lock()
+_counters: Counter = Counter()
+# name -> [count, total, max]
+_timings: dict[str, list] = {}
+# name -> largest value seen
+_peaks: dict[str, int] = {}
+
+
+def increment(name: str, amount: int = 1) -> None:
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name: str, seconds: float) -> None:
+    with _lock:
+        timing = _timings.setdefault(name, [0, 0.0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+
+def record_peak(name: str, value: int) -> None:
+    with _lock:
+        _peaks[name] = max(_peaks.get(name, 0), value)
+
+
+def snapshot() -> dict:
+    """Return this worker's counters, timings and peaks, tagged with its PID."""
+    with _lock:
+        return {
+            "pid": os.getpid(),
+            "counters": dict(_counters),
+            "timings": {
+                name: {"count": count, "mean": total / count, "max": worst}
+                for name, (count, total, worst) in _timings.items()
+            },
+            "peaks": dict(_peaks),
+        }
@@ -1,21 +1,44 @@
 from difflib import get_close_matches
 from PIL import Image
-from pytesseract import image_to_string
+import io
 import cv2
 import numpy as np
 
 from app.config import (
     TESSERACT_CONFIG,
+    OCR_MIN_CONFIDENCE,
+    REQUEST_MEMORY_BUDGET_BYTES,
     FUZZY_MATCH_CUTOFF,
     EXPECTED_IMAGE_SIZE,
     TEMPLATE_MATCH_THRESHOLD,
     NAME_LV_PATH,
 )
+from app.data.atlas import ATLAS_LAYOUT, ATLAS_SIZE
 from app.data.crops import CROPS
-from app.data.avatar_names import AVATAR_NAMES
-from app.data.weapon_names import WEAPON_NAMES
-from app.data.mainstats import MAINSTATS
-from app.data.substats import SUBSTATS
+from app.data.version import DATA_VERSION
+from app.services import cache, memprofile, metrics, tesseract
+from app.services.languages import (
+    NAME_FIELDS,
+    STAT_CHARS,
+    UNSPACED_LANGUAGES,
+    VOCABULARIES,
+    detect_language,
+    language_of,
+)
+from app.services.regions import blank_regions, region_hashes, tighten, unchanged_texts
+from app.services.rolls import is_plausible, snap_substat
+
+TEMPLATE_MATCH_ERROR = "Could not detect character name region"
+DIMENSIONS_ERROR = "Invalid image dimensions"
+
+
+class OCRCancelled(Exception):
+    """Raised inside the pipeline once its cancel token is set."""
+
+
+class MemoryBudgetExceeded(ValueError):
+    """Raised before decoding an upload that would not fit in REQUEST_MEMORY_BUDGET_BYTES."""
+
 
 # Load template image once at import time
 _name_lv_template = cv2.imread(str(NAME_LV_PATH), cv2.IMREAD_COLOR)
@@ -32,37 +55,27 @@ def _fuzzy_lookup(text: str, lookup: dict, cutoff: float = FUZZY_MATCH_CUTOFF):
     return None
 
 
-def avatar_name_to_id(text: str) -> str | None:
-    return _fuzzy_lookup(text, AVATAR_NAMES)
+def avatar_name_to_id(text: str, lang: str = "eng") -> str | None:
+    return _fuzzy_lookup(text, VOCABULARIES[lang]["avatar_names"])
 
 
-def weapon_name_to_id(text: str) -> int | None:
-    return _fuzzy_lookup(text, WEAPON_NAMES)
+def weapon_name_to_id(text: str, lang: str = "eng") -> int | None:
+    return _fuzzy_lookup(text, VOCABULARIES[lang]["weapon_names"])
 
 
-def mainstat_translate(text: str) -> str | None:
-    return _fuzzy_lookup(text, MAINSTATS)
+def mainstat_translate(text: str, lang: str = "eng") -> str | None:
+    return _fuzzy_lookup(text, VOCABULARIES[lang]["mainstats"])
 
 
-def substat_translate(text: str, has_percent: bool) -> str | None:
-    cleaned = text.strip()
-
-    # Try exact match first, then fuzzy
-    matched_key = None
-    if cleaned in SUBSTATS:
-        matched_key = cleaned
-    else:
-        matches = get_close_matches(cleaned, SUBSTATS.keys(), n=1, cutoff=FUZZY_MATCH_CUTOFF)
-        if matches:
-            matched_key = matches[0]
-
-    if matched_key is None:
+def substat_translate(text: str, has_percent: bool, lang: str = "eng") -> str | None:
+    stat = _fuzzy_lookup(text, VOCABULARIES[lang]["substats"])
+    if stat is None:
         return None
 
     # HP/ATK/DEF are flat or percent depending on has_percent
-    if matched_key in ("HP", "ATK", "DEF"):
-        return f"PERCENT_{matched_key}" if has_percent else f"FLAT_{matched_key}"
-    return f"PERCENT_{SUBSTATS[matched_key]}"
+    if stat in ("HP", "ATK", "DEF"):
+        return f"PERCENT_{stat}" if has_percent else f"FLAT_{stat}"
+    return f"PERCENT_{stat}"
 
 
 def value_translate(text: str) -> tuple[int | float | None, bool]:
@@ -79,60 +92,418 @@ def value_translate(text: str) -> tuple[int | float | None, bool]:
         return None, has_percent
 
 
-def _ocr_crop(image: Image.Image, crop_key: str) -> str:
-    """Crop the image and run OCR on the region."""
-    return image_to_string(image.crop(CROPS[crop_key]), config=TESSERACT_CONFIG)
+# Characters values can contain, for the restricted first OCR tier (labels use STAT_CHARS)
+_VALUE_CHARS = "0123456789.%"
+
+# Tiers tried in order until one result is confident and matches the crop's vocabulary
+_TIERS = ("fast", "default", "upscaled")
+
+
+def _crop_kind(crop_key: str) -> str:
+    """"echo0_sub3" -> "sub", "weapon_name" -> "weapon_name"."""
+    if not crop_key.startswith("echo"):
+        return crop_key
+    return crop_key.split("_")[1].rstrip("0123456789")
+
+
+def _validate(crop_key: str, text: str, lang: str):
+    """Translate text with the crop's vocabulary; None means it did not match."""
+    kind = _crop_kind(crop_key)
+    if kind == "avatar_name":
+        return avatar_name_to_id(text, lang)
+    if kind == "weapon_name":
+        return weapon_name_to_id(text, lang)
+    if kind == "main":
+        return mainstat_translate(text, lang)
+    if kind == "sub":
+        return substat_translate(text, True, lang)
+    value = value_translate(text)[0]
+    return value if value is not None and is_plausible(value) else None
+
+
+def _prepare_tier(
+    tier: str,
+    image: Image.Image,
+    crop_key: str,
+    box: tuple,
+    gray: np.ndarray | None,
+    lang: str,
+):
+    """Return the (crop, config) an OCR tier runs on."""
+    if tier == "fast":
+        # Tightened crop with the character set limited to the crop's vocabulary
+        crop = image.crop(box if gray is None else tighten(gray, box))
+        kind = _crop_kind(crop_key)
+        if kind == "val":
+            whitelist = _VALUE_CHARS
+        elif kind in ("main", "sub"):
+            whitelist = STAT_CHARS[lang]
+        else:
+            return crop, TESSERACT_CONFIG
+        return crop, f"{TESSERACT_CONFIG} -c tessedit_char_whitelist={whitelist}"
+
+    if tier == "default":
+        return image.crop(box), TESSERACT_CONFIG
+
+    # Upscaled 2x and re-thresholded, for small or low-contrast text
+    left, top, right, bottom = box
+    region = gray[top:bottom, left:right] if gray is not None else np.asarray(image.crop(box).convert("L"))
+    region = cv2.resize(region, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    _, region = cv2.threshold(region, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return Image.fromarray(region), TESSERACT_CONFIG
+
+
+def check_cancelled(cancel) -> None:
+    """Stop the pipeline if cancel (anything with is_set(), e.g. a threading.Event) is set."""
+    if cancel is not None and cancel.is_set():
+        metrics.increment("ocr.cancelled")
+        raise OCRCancelled()
+
+
+def _read(crop: Image.Image, config: str, lang: str, cancel=None) -> tuple[str, float]:
+    """
+    OCR a crop with the language's model, returning its text and mean word confidence.
+    A read that times out counts as an empty, zero-confidence one, so the caller escalates.
+    Raises OCRCancelled, killing Tesseract, once cancel is set.
+    """
+    try:
+        data = tesseract.image_to_data(crop, lang, config, cancel)
+    except tesseract.TesseractTimeout:
+        metrics.increment("ocr.timeout")
+        return "", 0.0
+    if data is None:
+        check_cancelled(cancel)
+    words, confidences = [], []
+    for word, conf in zip(data["text"], data["conf"]):
+        if word.strip() and float(conf) >= 0:
+            words.append(word)
+            confidences.append(float(conf))
+    if not words:
+        return "", 0.0
+    separator = "" if lang in UNSPACED_LANGUAGES else " "
+    return separator.join(words), sum(confidences) / len(confidences)
+
+
+def _ocr_crop(
+    image: Image.Image,
+    crop_key: str,
+    texts: dict | None = None,
+    gray: np.ndarray | None = None,
+    box: tuple[int, int, int, int] | None = None,
+    cancel=None,
+    lang: str = "eng",
+) -> str:
+    """
+    Crop the image and run OCR on the region (CROPS[crop_key] unless box is given,
+    e.g. from ATLAS_LAYOUT).
+    If texts is given, a text already recorded for crop_key is reused, and new text is recorded.
+    If gray (the grayscale frame) is given, the first tier reads the crop tightened to its text.
+    Escalates through _TIERS until a result passes OCR_MIN_CONFIDENCE and the crop's
+    vocabulary, falling back to the most confident reading.
+    Raises OCRCancelled before starting a Tesseract call once cancel is set.
+    lang is the screenshot's Tesseract language, which also selects the vocabulary.
+    """
+    if texts is not None and crop_key in texts:
+        metrics.increment("ocr_tier.cached")
+        return texts[crop_key]
+
+    box = box or CROPS[crop_key]
+    text, best_conf = "", -1.0
+    for tier in _TIERS:
+        check_cancelled(cancel)
+        crop, config = _prepare_tier(tier, image, crop_key, box, gray, lang)
+        tier_text, conf = _read(crop, config, lang, cancel)
+        if conf >= OCR_MIN_CONFIDENCE and _validate(crop_key, tier_text, lang) is not None:
+            metrics.increment(f"ocr_tier.{tier}")
+            text = tier_text
+            break
+        if conf > best_conf:
+            text, best_conf = tier_text, conf
+    else:
+        metrics.increment("ocr_tier.unresolved")
+
+    if texts is not None:
+        texts[crop_key] = text
+    return text
+
+
+def _confirm_language(
+    image: Image.Image,
+    lang: str,
+    texts: dict,
+    gray: np.ndarray,
+    blank: set[str],
+    layout: dict,
+    cancel=None,
+) -> bool:
+    """
+    Check a non-English detection by reading the first echo main stat with that language's
+    model: it must match the language's vocabulary. A confirmed reading is kept in texts.
+    """
+    for i in range(5):
+        key = f"echo{i}_main"
+        if key in blank:
+            continue
+        text = _ocr_crop(image, key, None, gray, layout[key], cancel, lang)
+        if mainstat_translate(text, lang) is None:
+            metrics.increment("language.rejected")
+            return False
+        texts[key] = text
+        return True
+    # No stat label to check against
+    return False
+
 
+def _needs_ocr(keys: set[str] | None, texts: dict, blank: set[str], layout: dict) -> bool:
+    """Whether any crop process_image would read has no text to reuse."""
+    for key in layout if keys is None else keys:
+        if key == "avatar_color" or key in texts:
+            continue
+        if key.startswith("echo"):
+            slot, region = key.split("_")
+            if f"{slot}_main" in blank or (region != "main" and f"{slot}_sub{region[-1]}" in blank):
+                continue
+        return True
+    return False
 
-def _extract_echo(image: Image.Image, echo_index: int) -> dict:
-    """Extract one echo's main stat and 5 substats."""
+
+def resolve_fields(fields: list[str] | None) -> set[str] | None:
+    """
+    Expand a field mask into the set of CROPS keys to OCR.
+    Accepts "avatar", "weapon", "echoN" or CROPS keys; None means every field.
+    Substat labels and values are always read together.
+    Raises ValueError on an unknown field.
+    """
+    if not fields:
+        return None
+
+    keys = set()
+    for field in fields:
+        field = field.strip()
+        if field == "avatar":
+            keys.add("avatar_name")
+        elif field == "weapon":
+            keys.add("weapon_name")
+        elif field.startswith("echo") and field[4:].isdigit() and f"{field}_main" in CROPS:
+            keys.update(key for key in CROPS if key.startswith(f"{field}_"))
+        elif field in CROPS and field != "avatar_color":
+            if "_sub" in field or "_val" in field:
+                prefix, row = field[:-5], field[-1]
+                keys.update((f"{prefix}_sub{row}", f"{prefix}_val{row}"))
+            else:
+                keys.add(field)
+        else:
+            raise ValueError(f"Unknown field: {field}")
+    return keys
+
+
+def _extract_echo(
+    image: Image.Image,
+    echo_index: int,
+    keys: set[str] | None = None,
+    texts: dict | None = None,
+    blank: set[str] = frozenset(),
+    gray: np.ndarray | None = None,
+    layout: dict = CROPS,
+    cancel=None,
+    lang: str = "eng",
+) -> dict:
+    """
+    Extract one echo's main stat and 5 substats, leaving unrequested ones as None.
+    An empty slot or substat row (listed in blank) is emitted with null values and not OCR'd.
+    """
     prefix = f"echo{echo_index}"
+    main_key = f"{prefix}_main"
+    empty_slot = main_key in blank
 
-    main_stat = _ocr_crop(image, f"{prefix}_main")
+    main_stat_id = None
+    if not empty_slot and (keys is None or main_key in keys):
+        main_text = _ocr_crop(image, main_key, texts, gray, layout[main_key], cancel, lang)
+        main_stat_id = mainstat_translate(main_text, lang)
 
     substats = []
     for sub_index in range(5):
-        sub_text = _ocr_crop(image, f"{prefix}_sub{sub_index}")
-        val_text = _ocr_crop(image, f"{prefix}_val{sub_index}")
+        sub_key, val_key = f"{prefix}_sub{sub_index}", f"{prefix}_val{sub_index}"
+        if keys is not None and sub_key not in keys:
+            substats.append(None)
+            continue
+        if empty_slot or sub_key in blank:
+            substats.append({"subStatId": None, "subStatValue": None})
+            continue
+        sub_text = _ocr_crop(image, sub_key, texts, gray, layout[sub_key], cancel, lang)
+        val_text = _ocr_crop(image, val_key, texts, gray, layout[val_key], cancel, lang)
         value, has_percent = value_translate(val_text)
-        substats.append({
-            "subStatId": substat_translate(sub_text, has_percent),
+        stat_id, value, flag = snap_substat(substat_translate(sub_text, has_percent, lang), value)
+        entry = {
+            "subStatId": stat_id,
             "subStatValue": value,
-        })
+        }
+        if flag is not None:
+            entry["valueFlag"] = flag
+        substats.append(entry)
 
     return {
-        "mainStatId": mainstat_translate(main_stat),
+        "mainStatId": main_stat_id,
         "subStatList": substats,
     }
 
 
-def process_image(image: Image.Image) -> dict | None:
+def process_image(
+    image: Image.Image,
+    on_echo=None,
+    keys: set[str] | None = None,
+    texts: dict | None = None,
+    atlas: bool = False,
+    cancel=None,
+) -> dict | None:
     """
-    Run full OCR extraction on a 1920x1080 screenshot.
+    Run OCR extraction on a 1920x1080 screenshot, or on a client-packed atlas of its
+    regions (see app/data/atlas.py) if atlas is set.
     Returns the structured result dict, or None if the template match fails.
+    keys (from resolve_fields) limits OCR to those crops; unrequested fields are
+    omitted, and unrequested echoes are None in equipList.
+    texts maps CROPS keys to raw OCR text: entries present are reused instead of
+    OCR'd, and every newly OCR'd crop is added to it. A reused weapon name also
+    gives the language, so detection is skipped.
+    on_echo, if given, is called with each echo index as it finishes.
+    Raises OCRCancelled between stages and crops once cancel is set.
     """
-    if image.size != EXPECTED_IMAGE_SIZE:
-        return {"error": f"Invalid image dimensions. Expected {EXPECTED_IMAGE_SIZE[0]}x{EXPECTED_IMAGE_SIZE[1]}"}
+    layout, size = (ATLAS_LAYOUT, ATLAS_SIZE) if atlas else (CROPS, EXPECTED_IMAGE_SIZE)
+    if image.size != size:
+        return {"error": f"{DIMENSIONS_ERROR}. Expected {size[0]}x{size[1]}"}
 
-    # Template match to find the end of the avatar name
-    avatar_region = np.array(image.crop(CROPS["avatar_name"]))
-    avatar_bgr = cv2.cvtColor(avatar_region, cv2.COLOR_RGB2BGR)
-    result = cv2.matchTemplate(avatar_bgr, _name_lv_template, cv2.TM_CCOEFF_NORMED)
-    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    with memprofile.stage("template_match"):
+        # Template match to find the end of the avatar name
+        avatar_bgr = cv2.cvtColor(np.array(image.crop(layout["avatar_name"])), cv2.COLOR_RGB2BGR)
+        _, max_val, _, max_loc = cv2.minMaxLoc(
+            cv2.matchTemplate(avatar_bgr, _name_lv_template, cv2.TM_CCOEFF_NORMED)
+        )
+        del avatar_bgr
 
     if max_val < TEMPLATE_MATCH_THRESHOLD:
         return None
+    check_cancelled(cancel)
 
-    # Crop avatar name up to where the "LV" template was found
-    avatar_name = image_to_string(
-        image.crop((71, 23, 65 + max_loc[0], 89)),
-        config=TESSERACT_CONFIG,
-    )
-    weapon_name = _ocr_crop(image, "weapon_name")
+    output = {}
+    texts = {} if texts is None else texts
+    with memprofile.stage("grayscale"):
+        gray = np.asarray(image.convert("L"))
+    # Skip OCR for missing echoes and substats that are not unlocked yet
+    blank = blank_regions(gray, layout)
 
-    echoes = [_extract_echo(image, i) for i in range(5)]
+    with memprofile.stage("language"):
+        if "weapon_name" in texts:
+            # Unchanged from an earlier upload, so its script gives the language
+            lang = language_of(texts["weapon_name"])
+        elif _needs_ocr(keys, texts, blank, layout):
+            # One read of the weapon name picks the language model for every other crop
+            lang, detected = detect_language(image.crop(layout["weapon_name"]), cancel)
+            check_cancelled(cancel)
+            if lang != "eng" and not _confirm_language(image, lang, texts, gray, blank, layout, cancel):
+                lang = "eng"
+            # Keep the reading as the weapon name, or just to remember the language
+            if detected and (
+                _validate("weapon_name", detected, lang) is not None
+                or "weapon_name" not in NAME_FIELDS[lang]
+            ):
+                texts["weapon_name"] = detected
+        else:
+            # Every crop is reused; stat labels are in the screenshot's script
+            lang = language_of(" ".join(text for key, text in texts.items() if "_val" not in key))
 
-    return {
-        "weaponId": weapon_name_to_id(weapon_name),
-        "equipList": echoes,
-    }
+    with memprofile.stage("names"):
+        # Names are left out for languages without localized name tables
+        if (keys is None or "avatar_name" in keys) and "avatar_name" in NAME_FIELDS[lang]:
+            # Crop avatar name up to where the "LV" template was found
+            left, top, _, bottom = layout["avatar_name"]
+            avatar_box = (left, top, left - 6 + max_loc[0], bottom)
+            avatar_name = _ocr_crop(image, "avatar_name", texts, gray, avatar_box, cancel, lang)
+            output["avatarId"] = avatar_name_to_id(avatar_name, lang)
+
+        if (keys is None or "weapon_name" in keys) and "weapon_name" in NAME_FIELDS[lang]:
+            weapon_name = _ocr_crop(image, "weapon_name", texts, gray, layout["weapon_name"], cancel, lang)
+            output["weaponId"] = weapon_name_to_id(weapon_name, lang)
+
+    with memprofile.stage("echoes"):
+        echoes = []
+        for i in range(5):
+            if keys is None or any(key.startswith(f"echo{i}_") for key in keys):
+                echoes.append(_extract_echo(image, i, keys, texts, blank, gray, layout, cancel, lang))
+            else:
+                echoes.append(None)
+            if on_echo is not None:
+                on_echo(i)
+
+    if keys is None or any(echo is not None for echo in echoes):
+        output["equipList"] = echoes
+
+    return output
+
+
+def result_key(digest: str, keys: set[str] | None = None) -> str:
+    """
+    Cache key for the result of OCRing the upload with this content hash under a field mask.
+    It includes DATA_VERSION, so results read with older data tables are not reused.
+    """
+    key = f"{digest}:{DATA_VERSION}"
+    return key if keys is None else f"{key}:{','.join(sorted(keys))}"
+
+
+def _decode(contents: bytes | bytearray) -> Image.Image:
+    """
+    Decode an upload, checking its decoded size against REQUEST_MEMORY_BUDGET_BYTES from the
+    header alone first. A bytearray is cleared once decoded, so the raw bytes are freed even
+    while callers still hold it.
+    """
+    buffer = io.BytesIO(contents)
+    if isinstance(contents, bytearray):
+        # BytesIO copied the bytes; the request's own copy is no longer needed
+        contents.clear()
+    with buffer:
+        image = Image.open(buffer)
+        width, height = image.size
+        # The decoded frame plus its grayscale copy
+        needed = buffer.getbuffer().nbytes + width * height * (len(image.getbands()) + 1)
+        if needed > REQUEST_MEMORY_BUDGET_BYTES:
+            raise MemoryBudgetExceeded(
+                f"Image needs about {needed / 2**20:.1f} MiB to process; the limit is "
+                f"{REQUEST_MEMORY_BUDGET_BYTES / 2**20:.1f} MiB"
+            )
+        image.load()
+    return image
+
+
+def process_upload(
+    contents: bytes | bytearray,
+    digest: str,
+    on_echo=None,
+    keys: set[str] | None = None,
+    ref: str | None = None,
+    atlas: bool = False,
+    cancel=None,
+) -> dict | None:
+    """
+    Decode an uploaded file, run process_image and cache a successful result.
+    The per-region hashes and OCR texts are stored under digest, so a later upload can pass it
+    as ref and re-OCR only the regions whose pixels changed.
+    Raises MemoryBudgetExceeded (a ValueError) if the upload is too large to decode.
+    """
+    with memprofile.stage("decode"):
+        image = _decode(contents)
+    layout, size = (ATLAS_LAYOUT, ATLAS_SIZE) if atlas else (CROPS, EXPECTED_IMAGE_SIZE)
+    if image.size != size:
+        return process_image(image, on_echo, keys, atlas=atlas, cancel=cancel)
+
+    with memprofile.stage("region_hashes"):
+        hashes = region_hashes(image, layout)
+    texts = {}
+    for prior_digest in (ref, digest):
+        prior = cache.get("regions", prior_digest) if prior_digest else None
+        if prior is not None:
+            texts.update(unchanged_texts(hashes, prior))
+
+    result = process_image(image, on_echo, keys, texts, atlas, cancel)
+    if result is not None and "error" not in result:
+        cache.put("result", result_key(digest, keys), result)
+        cache.put("regions", digest, {"hashes": hashes, "texts": texts})
+    return result
@@ -0,0 +1,69 @@
+import hashlib
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.config import BLANK_STDDEV_THRESHOLD, TIGHT_CROP_MARGIN
+from app.data.crops import CROPS
+
+# Boxes that are empty for missing echoes or substats not yet unlocked
+_ECHO_SLOT_KEYS = [key for key in CROPS if key.startswith("echo") and "_val" not in key]
+
+
+def region_hashes(image: Image.Image, layout: dict = CROPS) -> dict[str, str]:
+    """
+    Fingerprint the pixels inside every box of a decoded frame (CROPS or ATLAS_LAYOUT).
+    Each box is copied out on its own, so the frame is never copied whole.
+    """
+    return {
+        key: hashlib.blake2b(image.crop(box).tobytes(), digest_size=16).hexdigest()
+        for key, box in layout.items()
+    }
+
+
+def unchanged_texts(hashes: dict[str, str], prior: dict) -> dict[str, str]:
+    """Return the prior OCR texts whose regions are pixel-identical in the new frame."""
+    prior_hashes = prior["hashes"]
+    return {
+        key: text
+        for key, text in prior["texts"].items()
+        if prior_hashes.get(key) == hashes.get(key)
+    }
+
+
+def blank_regions(gray: np.ndarray, layout: dict = CROPS) -> set[str]:
+    """Return the echo main stat and substat label boxes of a grayscale frame that hold no text."""
+    blank = set()
+    for key in _ECHO_SLOT_KEYS:
+        left, top, right, bottom = layout[key]
+        if gray[top:bottom, left:right].std() < BLANK_STDDEV_THRESHOLD:
+            blank.add(key)
+    return blank
+
+
+def tighten(gray: np.ndarray, box: tuple[int, int, int, int]) -> tuple[int, int, int, int]:
+    """
+    Shrink a (left, top, right, bottom) box to the text inside it plus TIGHT_CROP_MARGIN.
+    Ink is the minority class after Otsu binarization; its row and column
+    projection profiles give the text extent. Boxes with no ink are returned unchanged.
+    """
+    left, top, right, bottom = box
+    region = gray[top:bottom, left:right]
+    if region.size == 0:
+        return box
+
+    _, binary = cv2.threshold(region, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    ink = binary if binary.mean() < 0.5 else 1 - binary
+
+    cols = np.flatnonzero(ink.any(axis=0))
+    rows = np.flatnonzero(ink.any(axis=1))
+    if cols.size == 0 or rows.size == 0:
+        return box
+
+    return (
+        max(left, left + int(cols[0]) - TIGHT_CROP_MARGIN),
+        max(top, top + int(rows[0]) - TIGHT_CROP_MARGIN),
+        min(right, left + int(cols[-1]) + 1 + TIGHT_CROP_MARGIN),
+        min(bottom, top + int(rows[-1]) + 1 + TIGHT_CROP_MARGIN),
+    )
@@ -0,0 +1,73 @@
+import numpy as np
+
+from app.data.substat_rolls import SUBSTAT_ROLLS
+
+# Roll tables in result units: value_translate turns "10.5%" into 0.105
+_ROLLS = {
+    stat_id: np.array(values) * (0.01 if stat_id.startswith("PERCENT_") else 1)
+    for stat_id, values in SUBSTAT_ROLLS.items()
+}
+# A reading within one roll step of a table value snaps to it
+_TOLERANCE = {stat_id: np.diff(values).min() for stat_id, values in _ROLLS.items()}
+# Every table flattened, for plausibility checks against all stats at once
+_ALL_ROLLS = np.concatenate(list(_ROLLS.values()))
+_ALL_TOLERANCES = np.concatenate([np.full(len(table), _TOLERANCE[stat_id]) for stat_id, table in _ROLLS.items()])
+
+# HP/ATK/DEF as the other flat/percent variant, with the factor that converts the reading
+_COUNTERPARTS = {
+    f"FLAT_{stat}": (f"PERCENT_{stat}", 0.01) for stat in ("HP", "ATK", "DEF")
+} | {
+    f"PERCENT_{stat}": (f"FLAT_{stat}", 100) for stat in ("HP", "ATK", "DEF")
+}
+
+# Readings tried for a value: as read, then with one or two dropped decimal points restored
+_DECIMAL_SHIFTS = np.array([1, 0.1, 0.01])
+
+
+def _as_number(value: float) -> int | float:
+    value = round(float(value), 4)
+    return int(value) if value.is_integer() else value
+
+
+def max_roll(stat_id: str) -> float:
+    """The largest value the substat can roll, in result units."""
+    return float(_ROLLS[stat_id].max())
+
+
+def is_plausible(value: int | float) -> bool:
+    """Whether the value is within tolerance of a roll of any substat."""
+    return bool(np.any(np.abs(_ALL_ROLLS - value) <= _ALL_TOLERANCES))
+
+
+def snap_substat(stat_id: str | None, value: int | float | None) -> tuple[str | None, int | float | None, str | None]:
+    """
+    Snap an OCR'd substat to the nearest value it can actually roll.
+    Returns (stat_id, value, flag): flag is None if the reading was exact, "corrected"
+    if the value (or the flat/percent choice) was changed, and "implausible" if no
+    candidate is close enough, in which case the reading is returned unchanged. A known
+    stat whose value could not be read at all is "implausible" too.
+    """
+    if stat_id not in _ROLLS:
+        return stat_id, value, None
+    if value is None:
+        return stat_id, None, "implausible"
+
+    candidates = [(stat_id, 1)]
+    if stat_id in _COUNTERPARTS:
+        candidates.append(_COUNTERPARTS[stat_id])
+
+    # Try the stat as read first, then its counterpart; within each, the reading as read first
+    for candidate, factor in candidates:
+        table = _ROLLS[candidate]
+        readings = value * factor * _DECIMAL_SHIFTS
+        distances = np.abs(readings[:, None] - table[None, :])
+        shift, nearest = np.unravel_index(distances.argmin(axis=None), distances.shape)
+        # Prefer the unshifted reading whenever it is within tolerance
+        if distances[0].min() <= _TOLERANCE[candidate]:
+            shift, nearest = 0, distances[0].argmin()
+        if distances[shift, nearest] <= _TOLERANCE[candidate]:
+            snapped = _as_number(table[nearest])
+            exact = candidate == stat_id and np.isclose(snapped, value)
+            return candidate, snapped, None if exact else "corrected"
+
+    return stat_id, value, "implausible"
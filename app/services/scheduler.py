@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from starlette.requests import Request
+
+from app.config import (
+    API_KEY_HEADER,
+    API_KEYS,
+    CLIENT_WEIGHTS,
+    OCR_CONCURRENCY,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_PER_SECOND,
+    TRUSTED_PROXY_HOPS,
+)
+from app.services import metrics
+from app.services.db import get_connection
+
+
+class RateLimited(Exception):
+    """Raised when a client's token bucket cannot cover a request."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded. Retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _client_host(request: Request) -> str:
+    """
+    The client's IP. Behind TRUSTED_PROXY_HOPS proxies it is the address the outermost one
+    appended to X-Forwarded-For; entries further left are client-supplied and ignored.
+    """
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [host.strip() for host in request.headers.get("X-Forwarded-For", "").split(",")]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS and forwarded[-TRUSTED_PROXY_HOPS]:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def identify(request: Request) -> tuple[str, str]:
+    """Return (client ID, client class) for a request."""
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key in API_KEYS:
+        return f"key:{api_key}", "api_key"
+    return f"ip:{_client_host(request)}", "anonymous"
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    client TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+_initialized = False
+# Full buckets are pruned once every this many admissions in each process
+_PRUNE_EVERY = 1000
+_admissions = itertools.count(1)
+
+
+def _conn():
+    global _initialized
+    conn = get_connection()
+    if not _initialized:
+        conn.execute(_SCHEMA)
+        _initialized = True
+    return conn
+
+
+def admit(client: str, cost: float) -> None:
+    """
+    Charge cost against the client's token bucket, or raise RateLimited.
+    Buckets live in the shared SQLite store, so the limit holds across worker processes.
+    A batch larger than the burst is admitted once the bucket is full and leaves it in debt.
+    """
+    now = time.time()
+    needed = min(cost, RATE_LIMIT_BURST)
+    refilled = "min(:burst, tokens + (:now - updated) * :rate)"
+    conn = _conn()
+    row = conn.execute(
+        f"""
+        INSERT INTO buckets (client, tokens, updated) VALUES (:client, :burst - :cost, :now)
+        ON CONFLICT (client) DO UPDATE SET tokens = {refilled} - :cost, updated = :now
+        WHERE {refilled} >= :needed
+        RETURNING tokens
+        """,
+        {
+            "client": client,
+            "burst": RATE_LIMIT_BURST,
+            "cost": cost,
+            "needed": needed,
+            "now": now,
+            "rate": RATE_LIMIT_PER_SECOND,
+        },
+    ).fetchone()
+    if next(_admissions) % _PRUNE_EVERY == 0:
+        conn.execute(
+            "DELETE FROM buckets WHERE tokens + (? - updated) * ? >= ?",
+            (now, RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST),
+        )
+    if row is None:
+        tokens, updated = conn.execute(
+            "SELECT tokens, updated FROM buckets WHERE client = ?", (client,)
+        ).fetchone()
+        tokens = min(RATE_LIMIT_BURST, tokens + (now - updated) * RATE_LIMIT_PER_SECOND)
+        metrics.increment("scheduler.rejected")
+        raise RateLimited(max(needed - tokens, 0.0) / RATE_LIMIT_PER_SECOND)
+
+
+# Weighted fair queueing over OCR_CONCURRENCY slots: each waiter is tagged with a
+# virtual finish time, and a freed slot goes to the smallest tag.
+_free_slots = OCR_CONCURRENCY
+_virtual_time = 0.0
+_last_finish: dict[str, float] = {}
+_waiters: list = []
+_sequence = itertools.count()
+
+
+def _grant_next() -> None:
+    global _free_slots, _virtual_time
+    while _free_slots and _waiters:
+        finish, _, future = heapq.heappop(_waiters)
+        if future.done():
+            continue
+        _virtual_time = max(_virtual_time, finish)
+        _free_slots -= 1
+        future.set_result(None)
+
+
+@asynccontextmanager
+async def slot(client: str, client_class: str, cost: float):
+    """
+    Hold one of the OCR slots. Under contention clients are served in weighted fair
+    order, so each gets slots in proportion to its class weight regardless of how
+    many requests it has queued. Queue wait is recorded per client class.
+    """
+    global _free_slots, _virtual_time
+    weight = CLIENT_WEIGHTS.get(client_class, 1.0)
+    finish = max(_virtual_time, _last_finish.get(client, 0.0)) + cost / weight
+    _last_finish[client] = finish
+
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(_waiters, (finish, next(_sequence), future))
+    started = time.monotonic()
+    _grant_next()
+    try:
+        await future
+    except asyncio.CancelledError:
+        if future.done() and not future.cancelled():
+            # Granted just as the caller went away: hand the slot on
+            _free_slots += 1
+            _grant_next()
+        raise
+    metrics.observe(f"queue_wait.{client_class}", time.monotonic() - started)
+
+    try:
+        yield
+    finally:
+        _free_slots += 1
+        if not _waiters and _free_slots == OCR_CONCURRENCY:
+            # Idle: restart virtual time so tags stay small
+            _virtual_time = 0.0
+            _last_finish.clear()
+        _grant_next()
+
+
+@contextmanager
+def thread_slot(loop: asyncio.AbstractEventLoop, client: str, client_class: str, cost: float):
+    """
+    Hold an OCR slot from a worker thread, in the same fair queue as requests served by loop.
+    Blocks the thread until the slot is granted.
+    """
+    granted = threading.Event()
+    release = []
+
+    async def hold():
+        done = asyncio.get_running_loop().create_future()
+        async with slot(client, client_class, cost):
+            release.append(done)
+            granted.set()
+            await done
+
+    future = asyncio.run_coroutine_threadsafe(hold(), loop)
+    while not granted.wait(0.5):
+        if future.done():
+            # The loop failed or shut down before granting the slot
+            future.result()
+            raise RuntimeError("OCR slot was never granted")
+    try:
+        yield
+    finally:
+        loop.call_soon_threadsafe(release[0].set_result, None)
+        future.result()
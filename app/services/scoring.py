@@ -0,0 +1,72 @@
+import numpy as np
+
+from app.data.avatar_names import AVATAR_NAMES
+from app.data.mainstats import MAINSTATS
+from app.data.stat_weights import CHARACTER_WEIGHTS, DEFAULT_WEIGHTS
+from app.data.substat_rolls import SUBSTAT_ROLLS
+from app.services.rolls import max_roll
+
+# One column per substat ID (valued in maximum rolls) and per main stat ID (present or not)
+SUBSTAT_IDS = list(SUBSTAT_ROLLS)
+MAINSTAT_IDS = list(dict.fromkeys(MAINSTATS.values()))
+STAT_IDS = SUBSTAT_IDS + MAINSTAT_IDS
+_COLUMNS = {stat_id: i for i, stat_id in enumerate(STAT_IDS)}
+_MAIN_OFFSET = len(SUBSTAT_IDS)
+_SUBSTAT_SCALE = np.array([max_roll(stat_id) for stat_id in SUBSTAT_IDS])
+
+# Row 0 holds the default weights, for characters not in AVATAR_NAMES
+CHARACTER_IDS = list(dict.fromkeys(AVATAR_NAMES.values()))
+_ROWS = {avatar_id: i + 1 for i, avatar_id in enumerate(CHARACTER_IDS)}
+
+
+def _weight_row(weights: dict) -> np.ndarray:
+    row = np.zeros(len(STAT_IDS))
+    for stat_id, weight in weights.items():
+        if stat_id in _COLUMNS:
+            row[_COLUMNS[stat_id]] = weight
+    return row
+
+
+WEIGHT_MATRIX = np.stack(
+    [_weight_row(DEFAULT_WEIGHTS)]
+    + [_weight_row(DEFAULT_WEIGHTS | CHARACTER_WEIGHTS.get(avatar_id, {})) for avatar_id in CHARACTER_IDS]
+)
+
+
+def stat_tensor(equip_lists: list[list]) -> np.ndarray:
+    """
+    Turn equipLists (as returned by process_image) into a (builds, 5 echoes, stats)
+    tensor. Substats are counted in maximum rolls; missing or unreadable entries are zero.
+    """
+    tensor = np.zeros((len(equip_lists), 5, len(STAT_IDS)))
+    for b, equip_list in enumerate(equip_lists):
+        for e, echo in enumerate((equip_list or [])[:5]):
+            if not echo:
+                continue
+            main_column = _COLUMNS.get(echo.get("mainStatId"), -1)
+            if main_column >= _MAIN_OFFSET:
+                tensor[b, e, main_column] = 1.0
+            for substat in echo.get("subStatList") or []:
+                if not substat or substat.get("subStatValue") is None:
+                    continue
+                column = _COLUMNS.get(substat.get("subStatId"), -1)
+                if 0 <= column < _MAIN_OFFSET:
+                    tensor[b, e, column] += substat["subStatValue"]
+    tensor[:, :, :_MAIN_OFFSET] /= _SUBSTAT_SCALE
+    return tensor
+
+
+def score_builds(builds: list[dict]) -> list[dict]:
+    """
+    Score many builds ({"avatarId", "equipList"}) in one batched operation, using each
+    character's weights. Returns {"score", "echoScores"} per build, in order.
+    """
+    if not builds:
+        return []
+    tensor = stat_tensor([build.get("equipList") for build in builds])
+    rows = np.array([_ROWS.get(build.get("avatarId"), 0) for build in builds])
+    echo_scores = np.einsum("bes,bs->be", tensor, WEIGHT_MATRIX[rows]).round(4)
+    return [
+        {"score": float(scores.sum().round(4)), "echoScores": scores.tolist()}
+        for scores in echo_scores
+    ]
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+# Computations in flight in this worker process, keyed by request key.
+# Each entry is [task, cancel event, number of callers still waiting].
+_inflight: dict[str, list] = {}
+
+
+def _finish(key: str, flight: list, task: asyncio.Task) -> None:
+    if _inflight.get(key) is flight:
+        del _inflight[key]
+    # Mark a failure as retrieved even when every caller has gone away
+    if not task.cancelled():
+        task.exception()
+
+
+def pending(key: str) -> bool:
+    """Whether a computation for key is already running that a new caller would share."""
+    flight = _inflight.get(key)
+    return flight is not None and not flight[1].is_set()
+
+
+async def run(key: str, fn, *args, disconnected=None):
+    """
+    Await the coroutine fn(*args, cancel=event), sharing one computation among
+    concurrent callers with the same key. Every caller gets the same result
+    (or exception); a caller that goes away does not cancel it for the rest.
+    Only the caller that starts a computation runs fn, so anything fn waits for
+    (such as an OCR slot) is waited for once per key.
+
+    disconnected, if given, is an awaitable that completes when this caller's client
+    goes away; the caller then gets ConnectionAbortedError. Once no caller is left
+    waiting, the event is set so fn can stop early.
+    """
+    flight = _inflight.get(key)
+    # A flight whose callers all left is winding down; start a fresh one
+    if flight is None or flight[1].is_set():
+        cancel = threading.Event()
+        task = asyncio.ensure_future(fn(*args, cancel=cancel))
+        flight = _inflight[key] = [task, cancel, 0]
+        task.add_done_callback(lambda t, flight=flight: _finish(key, flight, t))
+    task, cancel, _ = flight
+    flight[2] += 1
+
+    watcher = None if disconnected is None else asyncio.ensure_future(disconnected)
+    try:
+        if watcher is None:
+            return await asyncio.shield(task)
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        raise ConnectionAbortedError()
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        flight[2] -= 1
+        if flight[2] == 0 and not task.done():
+            cancel.set()
@@ -0,0 +1,64 @@
+import io
+import shlex
+import subprocess
+import time
+
+from PIL import Image
+from pytesseract import pytesseract
+
+from app.config import OCR_TIMEOUT_SECONDS
+
+# How often a running Tesseract process checks its cancel token
+_POLL_SECONDS = 0.05
+
+
+class TesseractTimeout(RuntimeError):
+    """Raised when a Tesseract call runs past OCR_TIMEOUT_SECONDS; the process is killed."""
+
+
+def _run(image: Image.Image, lang: str, config: str, output: str, cancel=None) -> str | None:
+    """
+    Run Tesseract on image through a process handle, returning its output in the given
+    format ("txt" or "tsv"). The process is killed once cancel (anything with is_set())
+    is set, and None is returned, or once it passes OCR_TIMEOUT_SECONDS.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    args = [pytesseract.tesseract_cmd, "stdin", "stdout", "-l", lang, *shlex.split(config), output]
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + OCR_TIMEOUT_SECONDS
+    data = buffer.getvalue()
+    with process:
+        while True:
+            try:
+                stdout, stderr = process.communicate(data, timeout=_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                # communicate keeps writing the input it was first given
+                data = None
+                if cancel is not None and cancel.is_set():
+                    process.kill()
+                    return None
+                if time.monotonic() > deadline:
+                    process.kill()
+                    raise TesseractTimeout("Tesseract process timeout")
+    if process.returncode != 0:
+        raise pytesseract.TesseractError(process.returncode, stderr.decode("utf-8", errors="replace").strip())
+    return stdout.decode("utf-8", errors="replace")
+
+
+def image_to_data(image: Image.Image, lang: str, config: str, cancel=None) -> dict | None:
+    """Like pytesseract.image_to_data with Output.DICT (text and conf only), but cancellable."""
+    output = _run(image, lang, config, "tsv", cancel)
+    if output is None:
+        return None
+    lines = output.splitlines()
+    header = lines[0].split("\t") if lines else []
+    rows = [line.split("\t") for line in lines[1:]]
+    columns = {name: [row[i] if i < len(row) else "" for row in rows] for i, name in enumerate(header)}
+    return {"text": columns.get("text", []), "conf": columns.get("conf", [])}
+
+
+def image_to_string(image: Image.Image, lang: str, config: str, cancel=None) -> str | None:
+    """Like pytesseract.image_to_string, but cancellable."""
+    return _run(image, lang, config, "txt", cancel)
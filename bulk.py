@@ -0,0 +1,213 @@
+"""
+Bulk OCR for directories of screenshots, without going through HTTP.
+
+    python bulk.py screenshots/ --output results.jsonl
+    python bulk.py --list paths.txt --output results.csv --workers 8
+
+Results are appended as they finish, one row per screenshot. Re-running with the
+same output skips screenshots already in it, so an interrupted run resumes.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app.config import WORKERS
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+CSV_COLUMNS = ["path", "avatarId", "weaponId", "equipList", "error"]
+
+
+def _collect_paths(inputs: list[str], list_file: str | None) -> list[str]:
+    paths = []
+    if list_file:
+        with open(list_file) as f:
+            paths.extend(line.strip() for line in f if line.strip())
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, dirs, files in os.walk(entry):
+                dirs.sort()
+                paths.extend(
+                    os.path.join(root, name)
+                    for name in sorted(files)
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+                )
+        else:
+            paths.append(entry)
+    return paths
+
+
+def _is_final(error: str) -> bool:
+    """Whether an error row would come out the same on a re-run (empty means a result)."""
+    from app.services.ocr_service import DIMENSIONS_ERROR, TEMPLATE_MATCH_ERROR
+
+    return not error or error == TEMPLATE_MATCH_ERROR or error.startswith(DIMENSIONS_ERROR)
+
+
+def _finished_paths(output: str, fmt: str) -> set[str]:
+    """
+    Paths already written to output by an earlier run, with a result or an error that a
+    re-run would repeat. Paths that failed to read or decode are tried again.
+    """
+    if not os.path.exists(output):
+        return set()
+    finished = set()
+    with open(output, newline="") as f:
+        if fmt == "csv":
+            finished.update(
+                row["path"] for row in csv.DictReader(f) if row.get("path") and _is_final(row.get("error") or "")
+            )
+        else:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                    path = row["path"]
+                except (ValueError, KeyError):
+                    # Partially written last line of an interrupted run
+                    continue
+                if "result" in row or _is_final(row.get("error", "")):
+                    finished.add(path)
+    return finished
+
+
+def _prefetch(paths: list[str], out: queue.Queue) -> None:
+    """Read files ahead of the workers so they never wait on disk."""
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                out.put((path, f.read(), None))
+        except OSError as e:
+            out.put((path, None, str(e)))
+    out.put(None)
+
+
+def _init_worker() -> None:
+    # Load the template and lookup tables once per worker process
+    import app.services.ocr_service  # noqa: F401
+
+
+def _process(path: str, contents: bytes, keys: set[str] | None) -> dict:
+    from PIL import Image
+
+    from app.services.ocr_service import TEMPLATE_MATCH_ERROR, process_image
+
+    try:
+        result = process_image(Image.open(io.BytesIO(contents)), keys=keys)
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+    if result is None:
+        return {"path": path, "error": TEMPLATE_MATCH_ERROR}
+    if "error" in result:
+        return {"path": path, "error": result["error"]}
+    return {"path": path, "result": result}
+
+
+class _Writer:
+    def __init__(self, output: str, fmt: str):
+        needs_header = fmt == "csv" and not (os.path.exists(output) and os.path.getsize(output))
+        self._file = open(output, "a", newline="")
+        if self._file.tell() and not self._ends_with_newline(output):
+            self._file.write("\n")
+        self._csv = csv.DictWriter(self._file, CSV_COLUMNS) if fmt == "csv" else None
+        if needs_header:
+            self._csv.writeheader()
+
+    @staticmethod
+    def _ends_with_newline(output: str) -> bool:
+        with open(output, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def write(self, row: dict) -> None:
+        if self._csv is None:
+            self._file.write(json.dumps(row) + "\n")
+        else:
+            result = row.get("result", {})
+            self._csv.writerow({
+                "path": row["path"],
+                "avatarId": result.get("avatarId"),
+                "weaponId": result.get("weaponId"),
+                "equipList": json.dumps(result["equipList"]) if "equipList" in result else "",
+                "error": row.get("error", ""),
+            })
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _report(done: int, total: int, started: float) -> None:
+    elapsed = time.monotonic() - started
+    rate = done / elapsed if elapsed else 0.0
+    eta = (total - done) / rate if rate else 0.0
+    sys.stderr.write(f"\r{done}/{total} screenshots, {rate:.1f}/s, ETA {eta:.0f}s ")
+    sys.stderr.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run OCR over many screenshots.")
+    parser.add_argument("inputs", nargs="*", help="screenshot files or directories")
+    parser.add_argument("--list", help="file with one screenshot path per line")
+    parser.add_argument("--output", required=True, help="results file (.jsonl or .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="defaults to the output extension")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="OCR processes")
+    parser.add_argument("--fields", help="comma-separated field mask, as for /ocr/")
+    args = parser.parse_args()
+
+    from app.services.ocr_service import resolve_fields
+
+    fmt = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    # Reject a bad mask before any screenshot is processed
+    try:
+        keys = resolve_fields(args.fields.split(",") if args.fields else None)
+    except ValueError as e:
+        parser.error(str(e))
+
+    paths = _collect_paths(args.inputs, args.list)
+    finished = _finished_paths(args.output, fmt)
+    pending = [path for path in paths if path not in finished]
+    if finished:
+        sys.stderr.write(f"Resuming: {len(paths) - len(pending)} of {len(paths)} already done\n")
+
+    files: queue.Queue = queue.Queue(maxsize=args.workers * 4)
+    threading.Thread(target=_prefetch, args=(pending, files), daemon=True).start()
+
+    writer = _Writer(args.output, fmt)
+    started = time.monotonic()
+    done = 0
+    in_flight = set()
+    exhausted = False
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        while in_flight or not exhausted:
+            # Keep every worker busy with a couple of screenshots queued behind it
+            while not exhausted and len(in_flight) < args.workers * 2:
+                item = files.get()
+                if item is None:
+                    exhausted = True
+                    break
+                path, contents, error = item
+                if error is not None:
+                    writer.write({"path": path, "error": error})
+                    done += 1
+                    continue
+                in_flight.add(pool.submit(_process, path, contents, keys))
+            if not in_flight:
+                continue
+            completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                writer.write(future.result())
+                done += 1
+            _report(done, len(pending), started)
+
+    writer.close()
+    sys.stderr.write("\n")
+
+
+if __name__ == "__main__":
+    main()
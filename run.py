@@ -1,5 +1,10 @@
 import uvicorn
 
-if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+from app.config import WORKERS
 
+if __name__ == "__main__":
+    if WORKERS > 1:
+        # Workers share the SQLite cache at CACHE_PATH; reload only supports one process
+        uvicorn.run("app.main:app", host="0.0.0.0", port=8000, workers=WORKERS)
+    else:
+        uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
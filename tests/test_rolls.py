@@ -0,0 +1,70 @@
+import pytest
+
+from app.services.ocr_service import resolve_fields
+from app.services.rolls import is_plausible, snap_substat
+
+
+@pytest.mark.parametrize("stat_id, value", [
+    ("PERCENT_CR", 0.105),
+    ("PERCENT_DEF", 0.147),
+    ("FLAT_HP", 470),
+])
+def test_exact_roll_is_unflagged(stat_id, value):
+    assert snap_substat(stat_id, value) == (stat_id, value, None)
+
+
+def test_near_roll_snaps():
+    assert snap_substat("FLAT_ATK", 45) == ("FLAT_ATK", 40, "corrected")
+
+
+@pytest.mark.parametrize("value", [1.05, 10.5])
+def test_dropped_decimal_point_is_restored(value):
+    assert snap_substat("PERCENT_CR", value) == ("PERCENT_CR", 0.105, "corrected")
+
+
+def test_shifted_reading_snaps_to_nearest_roll():
+    # "58%" is read as 0.58; shifted to 5.8% it is one step from the 6.4% roll
+    assert snap_substat("PERCENT_HP", 0.58) == ("PERCENT_HP", 0.064, "corrected")
+
+
+def test_flat_reading_becomes_percent():
+    # No flat HP roll is near 7.9, but 7.9% HP is a roll
+    assert snap_substat("FLAT_HP", 7.9) == ("PERCENT_HP", 0.079, "corrected")
+
+
+def test_percent_reading_becomes_flat():
+    assert snap_substat("PERCENT_ATK", 50) == ("FLAT_ATK", 50, "corrected")
+
+
+def test_implausible_reading_is_unchanged():
+    assert snap_substat("PERCENT_CD", 0.3) == ("PERCENT_CD", 0.3, "implausible")
+
+
+def test_unreadable_value_is_implausible():
+    assert snap_substat("PERCENT_CR", None) == ("PERCENT_CR", None, "implausible")
+
+
+@pytest.mark.parametrize("stat_id, value", [(None, None), (None, 0.105), ("UNKNOWN", 5)])
+def test_unknown_stat_is_unchanged(stat_id, value):
+    assert snap_substat(stat_id, value) == (stat_id, value, None)
+
+
+def test_is_plausible():
+    assert is_plausible(0.105)
+    assert is_plausible(470)
+    assert not is_plausible(5.0)
+
+
+def test_resolve_fields():
+    assert resolve_fields(None) is None
+    assert resolve_fields(["avatar", " weapon"]) == {"avatar_name", "weapon_name"}
+    assert resolve_fields(["echo0_sub1"]) == {"echo0_sub1", "echo0_val1"}
+    assert resolve_fields(["echo0_val1"]) == {"echo0_sub1", "echo0_val1"}
+    echo = resolve_fields(["echo1"])
+    assert "echo1_main" in echo and all(key.startswith("echo1_") for key in echo)
+
+
+@pytest.mark.parametrize("field", ["echo9", "avatar_color", "stats"])
+def test_resolve_fields_rejects_unknown(field):
+    with pytest.raises(ValueError):
+        resolve_fields([field])